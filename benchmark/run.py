@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+""" Benchmark suite of romea_path_tools.
+
+Every case is executed in a forked process to isolate its peak memory usage. The forked process
+shares the memory of the main process (the synthetic path for example), so the memory used by a
+case is measured by the increase of the peak memory during its execution. The results are saved
+in a JSON file that can be compared to a previous run used as baseline.
+"""
+import argparse
+import copy
+import datetime
+import fnmatch
+import importlib.machinery
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np  # noqa: E402
+from pymap3d import enu  # noqa: E402
+
+from romea_path_tools.path import Path  # noqa: E402
+from romea_path_tools.deviation import Deviation  # noqa: E402
+from romea_path_tools.zones import sub_path  # noqa: E402
+from synthetic import (  # noqa: E402
+    generate_path, lateral_deviation, headland_polygon, save_romea_v1, save_field_kml
+)
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000, 10000000]
+# absolute increase of the execution time (in seconds) always allowed, the shortest cases are
+# dominated by the noise of the measurements
+TIME_TOLERANCE_S = .05
+# memory increase (in MB) below which the memory used by two runs is not compared
+MIN_MEMORY_INCREASE_MB = 1.
+# number of points of a section of the paths compared by the deviation cases, a swath of 100 m and
+# its U-turn recorded every 10 cm
+POINTS_PER_RECORDED_SECTION = 1000
+
+FORMATS = {
+    'tiara': ('.traj', Path.save),
+    'csv': ('.csv', Path.save_csv),
+    'wgs84_csv': ('.wgs84.csv', Path.save_wgs84_csv),
+    'kml': ('.kml', Path.save_kml),
+    'geojson': ('.geojson', Path.save_geojson),
+    'romea_v1': ('.txt', save_romea_v1),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]),
+        description="""\
+            Run the benchmarks on synthetic trajectories and save the results in a JSON file.
+            If a baseline is given, the results are compared to it and the program fails if a
+            case is slower or uses more memory than the allowed thresholds.
+        """,
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=lambda s: int(float(s)),
+        nargs="+",
+        default=DEFAULT_SIZES,
+        metavar="N",
+        help="number of points of the synthetic trajectories (default: 1e3 to 1e7)",
+    )
+    parser.add_argument(
+        "-c",
+        "--cases",
+        type=str,
+        nargs="+",
+        default=["*"],
+        metavar="pattern",
+        help="only run the cases matching these patterns (example: 'load_*' 'merge')",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="number of runs of each case, the best is kept (default: 3)",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default="benchmark_results.json", help="output JSON file"
+    )
+    parser.add_argument("-b", "--baseline", type=str, default=None, help="baseline JSON file")
+    parser.add_argument(
+        "--time-threshold",
+        type=float,
+        default=0.1,
+        help="allowed relative increase of the execution time, in addition to an increase of "
+        f"{TIME_TOLERANCE_S} s (default: 0.1)",
+    )
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.1,
+        help="allowed relative increase of the memory used by a case, the increases smaller than "
+        f"{MIN_MEMORY_INCREASE_MB} MB are not compared (default: 0.1)",
+    )
+    return parser.parse_args()
+
+
+def load_script(name: str):
+    """ Import a program of the 'scripts' directory as a python module """
+    filename = os.path.join(REPO_DIR, 'scripts', name)
+    loader = importlib.machinery.SourceFileLoader(f'romea_path_tools_{name}', filename)
+    spec = importlib.util.spec_from_loader(loader.name, loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(operation, connection):
+    """ Executed in the forked process """
+    try:
+        rss_before = max_rss_mb()
+        start = time.perf_counter()
+        operation()
+        duration = time.perf_counter() - start
+        rss_after = max_rss_mb()
+        connection.send({
+            'time_s': duration,
+            'peak_memory_mb': rss_after,
+            'memory_increase_mb': rss_after - rss_before,
+        })
+    except Exception as e:
+        connection.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        connection.close()
+
+
+def run_case(operation, repeat: int):
+    """ Run the operation 'repeat' times in a forked process and keep the best run """
+    context = multiprocessing.get_context('fork')
+    best = None
+
+    for _ in range(repeat):
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=measure, args=(operation, sender))
+        process.start()
+        sender.close()
+        try:
+            result = receiver.recv()
+        except EOFError:
+            result = {'error': f'process terminated with exit code {process.exitcode}'}
+        process.join()
+
+        if 'error' in result:
+            return result
+        if best is None or result['time_s'] < best['time_s']:
+            best = result
+
+    return best
+
+
+def build_cases(path: Path, size: int, work_dir: str, scripts: dict):
+    """ Return the list of (name, operation, setup) to benchmark for a synthetic path.
+    The optional 'setup' function is called in the main process before running the case.
+    """
+    cases = []
+
+    for name, (extension, save) in FORMATS.items():
+        filename = os.path.join(work_dir, f'{size}{extension}')
+        save_file = lambda save=save, f=filename: save(path, f)
+        # the 'save' case already creates the file read by the 'load' case
+        create_file = lambda save=save, f=filename: os.path.exists(f) or save(path, f)
+        cases.append((f'save_{name}', save_file, None))
+        cases.append((f'load_{name}', lambda f=filename: Path.load(f), create_file))
+
+    convert = scripts['convert']
+    angle = 30 * math.pi / 180
+
+    def convert_rotation():
+        convert.create_points(path, Path(), [0., 0.], angle)
+
+    def convert_offset():
+        direction = convert.initial_path_direction(path)
+        offset = convert.rotate_from_dir(direction, [2., -1.])
+        convert.create_points(path, Path(), offset, 0.)
+
+    def convert_anchor():
+        anchor = path.anchor
+        new_anchor = (anchor[0] + 1e-4, anchor[1] - 1e-4, anchor[2])
+        e, n, u = enu.geodetic2enu(*anchor, *new_anchor)
+        convert.create_points(path, Path(), [e, n], angle)
+
+    cases += [
+        ('convert_rotation', convert_rotation, None),
+        ('convert_offset', convert_offset, None),
+        ('convert_anchor', convert_anchor, None),
+    ]
+
+    second_path = {}
+
+    def create_second_path():
+        second_path['path'] = copy.deepcopy(path)
+
+    cases.append(('merge', lambda: scripts['merge'].merge_two_paths(path, second_path['path']),
+                  create_second_path))
+
+    # the deviation is computed between recordings, whose spacing does not depend on the size
+    recordings = {}
+
+    def recorded_reference():
+        if 'reference' not in recordings:
+            section_count = size // POINTS_PER_RECORDED_SECTION
+            recordings['reference'] = generate_path(size, section_count=section_count)
+        return recordings['reference']
+
+    def create_aborted():
+        # mission aborted in the middle: half of the reference is far from the actual path
+        recordings['aborted'] = sub_path(recorded_reference(), 0, max(1, size // 2))
+
+    def create_deviated():
+        recordings['deviated'] = lateral_deviation(recorded_reference(), .3)
+
+    cases.append(('deviation_aborted',
+                  lambda: Deviation(recordings['reference'], recordings['aborted']).summary(),
+                  create_aborted))
+    cases.append(('deviation_noise',
+                  lambda: Deviation(recordings['reference'], recordings['deviated']).summary(),
+                  create_deviated))
+
+    if 'annotate' in scripts:
+        import matplotlib.patches as mpatches
+
+        polygon = mpatches.Polygon(headland_polygon(path), closed=True)
+        annotator = SimpleNamespace(path=path, positions=path.positions(), zone_name='headland')
+        build_annotations = scripts['annotate'].Annotate.build_annotations
+        cases.append(('annotate', lambda: build_annotations(annotator, polygon), None))
+
+    if 'planner' in scripts:
+        kml_filename = os.path.join(work_dir, f'{size}_field.kml')
+
+        def planning():
+            generator = scripts['planner'].PathGenerator(1.58, 1.58, 3.5, 0)
+            generator.load_kml(kml_filename)
+            generator.generate_swaths()
+            generator.path_planning()
+            generator.export_path(os.path.join(work_dir, f'{size}_planned.traj'))
+
+        cases.append(('planner', planning, lambda: save_field_kml(size, kml_filename)))
+
+    return cases
+
+
+def load_scripts():
+    scripts = {}
+    for name in ['convert', 'merge', 'annotate', 'planner']:
+        try:
+            scripts[name] = load_script(name)
+        except ImportError as e:
+            print(f"[warning] cases of '{name}' are skipped: {e}", file=sys.stderr)
+    return scripts
+
+
+def git_commit():
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        )
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def compare(results: list, baseline: list, time_threshold: float, memory_threshold: float):
+    """ Return the list of messages describing the regressions compared to the baseline """
+    reference = {(r['case'], r['size']): r for r in baseline if 'error' not in r}
+    regressions = []
+
+    for result in results:
+        ref = reference.get((result['case'], result['size']))
+        if ref is None or 'error' in result:
+            continue
+
+        time_ratio = result['time_s'] / ref['time_s']
+        memory_ratio = (max(result['memory_increase_mb'], MIN_MEMORY_INCREASE_MB)
+                        / max(ref['memory_increase_mb'], MIN_MEMORY_INCREASE_MB))
+        result['time_ratio'] = time_ratio
+        result['memory_ratio'] = memory_ratio
+
+        name = f"{result['case']} ({result['size']} points)"
+        if result['time_s'] > ref['time_s'] * (1 + time_threshold) + TIME_TOLERANCE_S:
+            regressions.append(f"{name}: time {ref['time_s']:.3f}s -> {result['time_s']:.3f}s")
+        if memory_ratio > 1 + memory_threshold:
+            regressions.append(
+                f"{name}: memory increase {ref['memory_increase_mb']:.1f}MB -> "
+                f"{result['memory_increase_mb']:.1f}MB"
+            )
+
+    return regressions
+
+
+def print_result(result: dict):
+    name = f"{result['case']:<18} {result['size']:>10}"
+    if 'error' in result:
+        print(f"{name}  error: {result['error']}")
+        return
+
+    line = (
+        f"{name}  {result['time_s']:9.3f} s  {result['throughput_pts_s']:12.0f} pts/s"
+        f"  {result['peak_memory_mb']:9.1f} MB (+{result['memory_increase_mb']:.1f} MB)"
+    )
+    print(line, flush=True)
+
+
+def main():
+    args = parse_args()
+    scripts = load_scripts()
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix='romea_path_tools_bench_') as work_dir:
+        for size in args.sizes:
+            path = generate_path(size)
+            for case, operation, setup in build_cases(path, size, work_dir, scripts):
+                if not any(fnmatch.fnmatch(case, pattern) for pattern in args.cases):
+                    continue
+                if setup is not None:
+                    setup()
+
+                result = {'case': case, 'size': size}
+                result.update(run_case(operation, args.repeat))
+                if 'error' not in result:
+                    result['throughput_pts_s'] = size / result['time_s']
+                print_result(result)
+                results.append(result)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(
+            results, baseline['results'], args.time_threshold, args.memory_threshold
+        )
+
+    with open(args.output, 'w') as f:
+        json.dump({'meta': metadata(), 'results': results}, f, indent=2)
+    print(f"Results saved in {args.output}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s) compared to '{args.baseline}':", file=sys.stderr)
+        for regression in regressions:
+            print(f"  {regression}", file=sys.stderr)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
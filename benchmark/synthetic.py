@@ -0,0 +1,164 @@
+""" Generate synthetic trajectories used by the benchmark suite.
+
+The generated paths look like the output of the planner: a sequence of parallel swaths linked by
+half-circle U-turns. Each swath (and the U-turn that follows it) is stored in its own section and
+is annotated with the zones 'work' and 'uturn'.
+"""
+import math
+import numpy as np
+from pymap3d import enu
+
+from romea_path_tools.path import Path
+from romea_path_tools.romea_path import RomeaPath, Point
+from romea_path_tools import kml
+
+DEFAULT_ANCHOR = (45.76277, 3.110397, 403.6)  # INRAE, Aubière, France
+
+
+def generate_path(
+    point_count: int,
+    section_count: int = 10,
+    swath_length: float = 100.,
+    swath_spacing: float = 3.,
+    work_ratio: float = .8,
+    seed: int = 0,
+):
+    """ Build a path of 'point_count' points with the columns 'x', 'y', 'speed' and 'curvature'.
+    The generation is deterministic for a given 'seed'.
+    """
+    rng = np.random.default_rng(seed)
+    radius = swath_spacing / 2
+    section_count = max(1, min(section_count, point_count))
+
+    path = Path()
+    path.name = f'synthetic_{point_count}'
+    path.anchor = DEFAULT_ANCHOR
+    path.columns = ['x', 'y', 'speed', 'curvature']
+
+    section_indexes = []
+    values = np.empty((point_count, 4))
+    begin = 0
+
+    for k, indexes in enumerate(np.array_split(np.arange(point_count), section_count)):
+        count = len(indexes)
+        ratio = np.arange(count) / count
+        work = ratio < work_ratio
+        work_count = int(np.count_nonzero(work))
+        direction = 1 if k % 2 == 0 else -1
+        y_center = k * swath_spacing + radius
+
+        # straight swath
+        start_x = 0. if direction > 0 else swath_length
+        x = start_x + direction * ratio / work_ratio * swath_length
+        y = np.full(count, k * swath_spacing)
+
+        # half circle at the end of the swath
+        angle = (ratio - work_ratio) / (1 - work_ratio) * math.pi
+        turn_x = (swath_length if direction > 0 else 0.) + direction * radius * np.sin(angle)
+        turn_y = y_center - radius * np.cos(angle)
+        x = np.where(work, x, turn_x)
+        y = np.where(work, y, turn_y)
+
+        section = values[begin:begin + count]
+        section[:, 0] = x + rng.normal(0, .01, count)
+        section[:, 1] = y + rng.normal(0, .01, count)
+        section[:, 2] = direction * (1. + rng.normal(0, .02, count))
+        section[:, 3] = np.where(work, 0., 1 / radius)
+
+        section_indexes.append(begin)
+        if work_count:
+            path.append_annotation('zone_enter', 'work', begin)
+            path.append_annotation('zone_exit', 'work', begin + work_count - 1)
+        if work_count < count:
+            path.append_annotation('zone_enter', 'uturn', begin + work_count)
+            path.append_annotation('zone_exit', 'uturn', begin + count - 1)
+
+        begin += count
+
+    path.points = np.round(values, 3).tolist()
+    path.create_sections(section_indexes)
+    return path
+
+
+def lateral_deviation(
+    path: Path,
+    deviation: float = .3,
+    correlation_length: float = 10.,
+    seed: int = 1,
+):
+    """ Return a copy of a path whose points are moved perpendicularly to the path by a random
+    distance with the standard deviation 'deviation', like a recording of the path with a drifting
+    localization: the distance varies smoothly over about 'correlation_length' meters of the path
+    """
+    rng = np.random.default_rng(seed)
+    positions = path.positions()
+    steps = np.hypot(*np.diff(positions, axis=0).T)
+    spacing = max(float(np.mean(steps)), 1e-6) if len(steps) else 1.
+
+    # direction of the path estimated on about 2 meters
+    span = max(1, round(1. / spacing))
+    indexes = np.arange(len(positions))
+    directions = (positions[np.minimum(indexes + span, len(positions) - 1)]
+                  - positions[np.maximum(indexes - span, 0)])
+    norms = np.hypot(directions[:, 0], directions[:, 1])
+    normals = np.column_stack([-directions[:, 1], directions[:, 0]])
+    np.divide(normals, norms[:, None], out=normals, where=norms[:, None] > 0)
+
+    # white noise smoothed by two moving averages over the correlation length
+    window = max(1, min(len(positions), round(correlation_length / spacing / 2)))
+    offsets = rng.normal(0, 1, len(positions) + 2 * window)
+    for _ in range(2):
+        sums = np.cumsum(offsets)
+        offsets = sums[window:] - sums[:-window]
+    offsets /= np.std(offsets) if len(offsets) > 1 else 1.
+    positions = positions + normals * (deviation * offsets)[:, None]
+
+    deviated = Path()
+    deviated.name = f'{path.name}_deviated'
+    deviated.anchor = path.anchor
+    deviated.columns = path.columns
+    values = np.array(path.points)
+    values[:, [path.columns.index('x'), path.columns.index('y')]] = positions
+    deviated.points = np.round(values, 3).tolist()
+    deviated.create_sections(path.section_indexes())
+    deviated.annotations = [dict(a) for a in path.annotations]
+    return deviated
+
+
+def headland_polygon(path: Path, swath_length: float = 100., margin: float = 1.):
+    """ Return the vertices of a polygon covering the U-turns at the end of the even swaths """
+    positions = path.positions()
+    y_min = positions[:, 1].min() - margin
+    y_max = positions[:, 1].max() + margin
+    x_max = positions[:, 0].max() + margin
+    x_min = swath_length - margin
+    return np.array([[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]])
+
+
+def save_romea_v1(path: Path, filename: str):
+    """ Save a path in the deprecated romea format ('.txt') """
+    xi = path.columns.index('x')
+    yi = path.columns.index('y')
+    si = path.columns.index('speed') if 'speed' in path.columns else None
+
+    romea_path = RomeaPath()
+    romea_path.anchor = path.anchor
+    for section in path.sections:
+        romea_path.sections.append([
+            Point(p[xi], p[yi], p[si] if si is not None else 0., 0, 4) for p in section
+        ])
+    romea_path.save(filename)
+
+
+def save_field_kml(point_count: int, filename: str, step_size: float = .1, width: float = 1.58):
+    """ Save a square field in a KML file. The size of the field is chosen to make the planner
+    generate approximately 'point_count' points.
+    """
+    side = math.sqrt(point_count * step_size * width)
+    corners = [(0, 0), (side, 0), (side, side), (0, side), (0, 0)]
+
+    kml_data = kml.Kml()
+    for x, y in corners:
+        lat, lon, alt = enu.enu2geodetic(x, y, 0, *DEFAULT_ANCHOR)
+        kml_data.add_point(lon, lat, alt)
+    kml_data.save(filename)
@@ -2,3 +2,4 @@ from . import kml
 from . import romea_path
 from . import path
 from . import plotter
+from . import zones
@@ -0,0 +1,450 @@
+""" Index of trajectory files stored in a local SQLite database.
+
+The catalog keeps some metadata of each file (anchor, columns, counts, length, zone names) and its
+footprint in WGS84 coordinates (bounding box and coarse geohash cells) to quickly find the files
+passing through an area without loading them.
+"""
+import os
+import json
+import fnmatch
+import hashlib
+import sqlite3
+from dataclasses import dataclass
+import numpy as np
+from pymap3d import enu
+
+from .path import Path
+from .grid import ranges, segment_cells
+from . import kml
+
+DEFAULT_DATABASE_NAME = '.romea_catalog.sqlite'
+GEOHASH_PRECISION = 6
+# the segments are straight in ENU coordinates but not in WGS84 coordinates, so the long segments
+# are split in pieces of this length (in meters) before computing the geohash cells they cross
+MAX_PIECE_LENGTH = 100.
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+SCHEMA = '''\
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    anchor TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    point_count INTEGER NOT NULL,
+    section_count INTEGER NOT NULL,
+    length REAL NOT NULL,
+    lat_min REAL, lon_min REAL, lat_max REAL, lon_max REAL
+);
+CREATE TABLE IF NOT EXISTS zones (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cells (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    cell TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_bbox ON files(lat_min, lat_max, lon_min, lon_max);
+CREATE INDEX IF NOT EXISTS zones_name ON zones(name);
+CREATE INDEX IF NOT EXISTS cells_file ON cells(file_id);
+'''
+
+
+@dataclass
+class CatalogEntry:
+    filename: str
+    anchor: tuple
+    columns: list
+    point_count: int
+    section_count: int
+    length: float
+    zones: list
+    bbox: tuple  # (lat_min, lon_min, lat_max, lon_max) or None for an empty path
+    cells: list
+
+
+def geohash_bits(precision: int):
+    """ Return the number of bits of the (lat, lon) indexes of the geohash cells """
+    bit_count = 5 * precision
+    return bit_count // 2, (bit_count + 1) // 2
+
+
+def geohash_coordinates(lat: np.ndarray, lon: np.ndarray, precision: int = GEOHASH_PRECISION):
+    """ Return the (lat, lon) coordinates expressed in geohash cells: the cell of indexes
+    (i, j) covers [i, i + 1[ x [j, j + 1[
+    """
+    lat_bits, lon_bits = geohash_bits(precision)
+    return ((np.asarray(lat, dtype=float) + 90) / 180 * (1 << lat_bits),
+            (np.asarray(lon, dtype=float) + 180) / 360 * (1 << lon_bits))
+
+
+def geohash_from_indexes(lat_index: np.ndarray, lon_index: np.ndarray,
+                         precision: int = GEOHASH_PRECISION):
+    """ Return the geohash strings of the cells of indexes (lat_index, lon_index) """
+    lat_bits, lon_bits = geohash_bits(precision)
+    lon_index = np.clip(np.asarray(lon_index, dtype=np.int64), 0, (1 << lon_bits) - 1)
+    lat_index = np.clip(np.asarray(lat_index, dtype=np.int64), 0, (1 << lat_bits) - 1)
+
+    # interleave the bits, starting by the longitude
+    code = np.zeros(lon_index.shape, np.int64)
+    for i in range(5 * precision):
+        if i % 2 == 0:
+            bit = (lon_index >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_index >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    hashes = []
+    for value in code.ravel().tolist():
+        chars = [GEOHASH_ALPHABET[(value >> (5 * (precision - 1 - i))) & 31]
+                 for i in range(precision)]
+        hashes.append(''.join(chars))
+    return hashes
+
+
+def geohash_encode(lat: np.ndarray, lon: np.ndarray, precision: int = GEOHASH_PRECISION):
+    """ Return the geohash strings of arrays of WGS84 coordinates """
+    lat_cells, lon_cells = geohash_coordinates(lat, lon, precision)
+    return geohash_from_indexes(np.floor(lat_cells), np.floor(lon_cells), precision)
+
+
+def polyline_geohashes(lat: np.ndarray, lon: np.ndarray, precision: int = GEOHASH_PRECISION):
+    """ Return the sorted geohash strings of the cells crossed by a polyline of WGS84 vertices """
+    lat_cells, lon_cells = geohash_coordinates(lat, lon, precision)
+    vertices = np.column_stack([lat_cells, lon_cells])
+    _, lat_index, lon_index = segment_cells(vertices[:-1], vertices[1:])
+    lat_index = np.concatenate([lat_index, np.floor(lat_cells).astype(np.int64)])
+    lon_index = np.concatenate([lon_index, np.floor(lon_cells).astype(np.int64)])
+
+    lat_bits, lon_bits = geohash_bits(precision)
+    lat_index = np.clip(lat_index, 0, (1 << lat_bits) - 1)
+    lon_index = np.clip(lon_index, 0, (1 << lon_bits) - 1)
+    keys = np.unique((lon_index << lat_bits) | lat_index)
+    return sorted(geohash_from_indexes(keys & ((1 << lat_bits) - 1), keys >> lat_bits, precision))
+
+
+def split_segments(positions: np.ndarray, max_length: float):
+    """ Return the vertices of a polyline whose segments are split in pieces of at most
+    'max_length'
+    """
+    deltas = np.diff(positions, axis=0)
+    counts = np.maximum(np.ceil(np.linalg.norm(deltas, axis=1) / max_length), 1).astype(np.int64)
+    segments = np.repeat(np.arange(len(deltas)), counts)
+    ratios = ranges(np.zeros_like(counts), counts) / np.repeat(counts, counts)
+    pieces = positions[segments] + deltas[segments] * ratios[:, None]
+    return np.vstack([pieces, positions[-1:]])
+
+
+def geohash_bbox(geohash: str):
+    """ Return the (lat_min, lon_min, lat_max, lon_max) bounding box of a geohash cell """
+    lat_range = [-90., 90.]
+    lon_range = [-180., 180.]
+    is_lon = True
+
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if is_lon else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if (value >> shift) & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            is_lon = not is_lon
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def bbox_intersects(a: tuple, b: tuple):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def point_in_polygon(point: tuple, polygon: list):
+    """ Ray casting test, the polygon is a list of (lat, lon) vertices """
+    lat, lon = point
+    inside = False
+    for (lat1, lon1), (lat2, lon2) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (lat1 > lat) != (lat2 > lat):
+            cross_lon = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+            if lon < cross_lon:
+                inside = not inside
+    return inside
+
+
+def segments_intersect(p1, p2, q1, q2):
+    def orientation(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+
+    d1 = orientation(q1, q2, p1)
+    d2 = orientation(q1, q2, p2)
+    d3 = orientation(p1, p2, q1)
+    d4 = orientation(p1, p2, q2)
+    return (d1 > 0) != (d2 > 0) and (d3 > 0) != (d4 > 0)
+
+
+def bbox_intersects_polygon(bbox: tuple, polygon: list):
+    """ Return True if the bounding box and the polygon (list of (lat, lon)) intersect """
+    lat_min, lon_min, lat_max, lon_max = bbox
+    corners = [(lat_min, lon_min), (lat_min, lon_max), (lat_max, lon_max), (lat_max, lon_min)]
+
+    if any(point_in_polygon(corner, polygon) for corner in corners):
+        return True
+    if any(lat_min <= lat <= lat_max and lon_min <= lon <= lon_max for lat, lon in polygon):
+        return True
+
+    bbox_edges = list(zip(corners, corners[1:] + corners[:1]))
+    for edge in zip(polygon, polygon[1:] + polygon[:1]):
+        if any(segments_intersect(*edge, *bbox_edge) for bbox_edge in bbox_edges):
+            return True
+    return False
+
+
+def file_hash(filename: str):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def path_metadata(path: Path, precision: int = GEOHASH_PRECISION):
+    """ Compute the metadata stored in the catalog for a loaded path """
+    zones = sorted({a['value'] for a in path.annotations if a.get('type') == 'zone_enter'})
+    metadata = {
+        'anchor': tuple(path.anchor),
+        'columns': [c.strip() for c in path.columns],
+        'point_count': len(path.points),
+        'section_count': len(path.sections),
+        'length': 0.,
+        'zones': zones,
+        'bbox': None,
+        'cells': [],
+    }
+
+    if path.empty():
+        return metadata
+
+    positions = path.positions().astype(float)
+    metadata['length'] = float(np.linalg.norm(np.diff(positions, axis=0), axis=1).sum())
+
+    positions = split_segments(positions, MAX_PIECE_LENGTH)
+    lat, lon, _ = enu.enu2geodetic(positions[:, 0], positions[:, 1], 0, *path.anchor)
+    lat = np.atleast_1d(lat)
+    lon = np.atleast_1d(lon)
+    metadata['bbox'] = (float(lat.min()), float(lon.min()), float(lat.max()), float(lon.max()))
+    metadata['cells'] = polyline_geohashes(lat, lon, precision)
+    return metadata
+
+
+class Catalog:
+
+    def __init__(self, database: str, precision: int = GEOHASH_PRECISION):
+        self.database = database
+        self.precision = precision
+        self.connection = sqlite3.connect(database)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def update(self, root: str, patterns=('*.traj',)):
+        """ Scan the directory tree and update the entries of the modified files.
+        A file is reloaded only if its modification time or size changed and if its content hash
+        is different. Return the lists of (added, updated, removed, failed) filenames.
+        """
+        root = os.path.abspath(root)
+        added, updated, removed, failed = [], [], [], []
+        found = set()
+
+        known = {}
+        prefix = os.path.join(root, '')
+        rows = self.connection.execute('SELECT id, filename, mtime, size, hash FROM files')
+        for file_id, filename, mtime, size, digest in rows:
+            if filename.startswith(prefix):
+                known[filename] = (file_id, mtime, size, digest)
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            for basename in sorted(filenames):
+                if not any(fnmatch.fnmatch(basename, p) for p in patterns):
+                    continue
+
+                filename = os.path.join(dirpath, basename)
+                found.add(filename)
+                stat = os.stat(filename)
+
+                if filename in known:
+                    file_id, mtime, size, digest = known[filename]
+                    if mtime == stat.st_mtime and size == stat.st_size:
+                        continue
+
+                    new_digest = file_hash(filename)
+                    if new_digest == digest:
+                        self.connection.execute(
+                            'UPDATE files SET mtime = ?, size = ? WHERE id = ?',
+                            (stat.st_mtime, stat.st_size, file_id),
+                        )
+                        continue
+                else:
+                    new_digest = file_hash(filename)
+
+                try:
+                    metadata = path_metadata(Path.load(filename), self.precision)
+                except Exception as e:
+                    failed.append((filename, str(e)))
+                    continue
+
+                self._store(filename, stat, new_digest, metadata)
+                (updated if filename in known else added).append(filename)
+
+        for filename, (file_id, *_) in known.items():
+            if filename not in found:
+                self.connection.execute('DELETE FROM files WHERE id = ?', (file_id,))
+                removed.append(filename)
+
+        self.connection.commit()
+        return added, updated, removed, failed
+
+    def _store(self, filename: str, stat: os.stat_result, digest: str, metadata: dict):
+        self.connection.execute('DELETE FROM files WHERE filename = ?', (filename,))
+        bbox = metadata['bbox'] or (None, None, None, None)
+        cursor = self.connection.execute(
+            '''INSERT INTO files (filename, mtime, size, hash, anchor, columns, point_count,
+                section_count, length, lat_min, lon_min, lat_max, lon_max)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (
+                filename,
+                stat.st_mtime,
+                stat.st_size,
+                digest,
+                json.dumps(metadata['anchor']),
+                json.dumps(metadata['columns']),
+                metadata['point_count'],
+                metadata['section_count'],
+                metadata['length'],
+                *bbox,
+            ),
+        )
+        file_id = cursor.lastrowid
+        self.connection.executemany(
+            'INSERT INTO zones (file_id, name) VALUES (?, ?)',
+            [(file_id, name) for name in metadata['zones']],
+        )
+        self.connection.executemany(
+            'INSERT INTO cells (file_id, cell) VALUES (?, ?)',
+            [(file_id, cell) for cell in metadata['cells']],
+        )
+
+    def entry(self, filename: str):
+        """ Return the CatalogEntry of a file or None if it is not in the catalog """
+        row = self.connection.execute(
+            '''SELECT id, filename, anchor, columns, point_count, section_count, length,
+                lat_min, lon_min, lat_max, lon_max FROM files WHERE filename = ?''',
+            (os.path.abspath(filename),),
+        ).fetchone()
+        if row is None:
+            return None
+
+        file_id = row[0]
+        zones = [r[0] for r in self.connection.execute(
+            'SELECT name FROM zones WHERE file_id = ? ORDER BY name', (file_id,))]
+        cells = self._cells(file_id)
+        bbox = tuple(row[7:11]) if row[7] is not None else None
+        return CatalogEntry(row[1], tuple(json.loads(row[2])), json.loads(row[3]), row[4], row[5],
+                            row[6], zones, bbox, cells)
+
+    def _cells(self, file_id: int):
+        rows = self.connection.execute(
+            'SELECT cell FROM cells WHERE file_id = ? ORDER BY cell', (file_id,))
+        return [r[0] for r in rows]
+
+    def query(self, bbox: tuple = None, polygon: list = None, zone: str = None):
+        """ Return the sorted list of filenames matching all the given criteria:
+        - bbox: (lat_min, lon_min, lat_max, lon_max) that intersects the trajectory
+        - polygon: list of (lat, lon) vertices of a polygon that intersects the trajectory
+        - zone: name of a zone contained in the trajectory annotations
+        The spatial tests are done on the geohash cells, so some false positives are possible at
+        the scale of a cell but there are no false negatives.
+        """
+        conditions = []
+        params = []
+
+        if polygon is not None:
+            lats = [p[0] for p in polygon]
+            lons = [p[1] for p in polygon]
+            polygon_bbox = (min(lats), min(lons), max(lats), max(lons))
+            bbox = polygon_bbox if bbox is None else (
+                max(bbox[0], polygon_bbox[0]), max(bbox[1], polygon_bbox[1]),
+                min(bbox[2], polygon_bbox[2]), min(bbox[3], polygon_bbox[3]))
+
+        if bbox is not None:
+            conditions.append('lat_min <= ? AND lat_max >= ? AND lon_min <= ? AND lon_max >= ?')
+            params += [bbox[2], bbox[0], bbox[3], bbox[1]]
+
+        if zone is not None:
+            conditions.append('id IN (SELECT file_id FROM zones WHERE name = ?)')
+            params.append(zone)
+
+        sql = 'SELECT id, filename FROM files'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY filename'
+
+        filenames = []
+        for file_id, filename in self.connection.execute(sql, params).fetchall():
+            if bbox is not None:
+                cells = [geohash_bbox(cell) for cell in self._cells(file_id)]
+                cells = [cell for cell in cells if bbox_intersects(cell, bbox)]
+                if polygon is not None:
+                    cells = [cell for cell in cells if bbox_intersects_polygon(cell, polygon)]
+                if not cells:
+                    continue
+            filenames.append(filename)
+
+        return filenames
+
+
+def default_database(root: str):
+    return os.path.join(root, DEFAULT_DATABASE_NAME)
+
+
+def load_polygon(filename: str):
+    """ Load a polygon from a KML file and return a list of (lat, lon) vertices """
+    polygon = kml.parse_polygon(filename)
+    return [(p[1], p[0]) for p in polygon.geo_points]
+
+
+def add_query_arguments(parser):
+    """ Add the options used to query a catalog to an argparse parser """
+    parser.add_argument(
+        "--bbox",
+        type=float,
+        nargs=4,
+        default=None,
+        metavar=("lat_min", "lon_min", "lat_max", "lon_max"),
+        help="WGS84 bounding box intersecting the trajectories",
+    )
+    parser.add_argument(
+        "--polygon",
+        type=str,
+        default=None,
+        metavar="kml_file",
+        help="KML file containing a polygon intersecting the trajectories",
+    )
+    parser.add_argument(
+        "--zone", type=str, default=None, help="name of a zone contained in the trajectories"
+    )
+
+
+def query_from_args(catalog: Catalog, args):
+    """ Query the catalog using the options added by 'add_query_arguments' """
+    polygon = load_polygon(args.polygon) if args.polygon else None
+    return catalog.query(bbox=args.bbox, polygon=polygon, zone=args.zone)
@@ -0,0 +1,399 @@
+""" Deviation between a reference path (for example planned) and an actual path (recorded) """
+import json
+import numpy as np
+from pymap3d import enu
+
+from .path import Path
+from .zones import ZoneIndex
+from .grid import ranges, segment_cells
+
+# the keys of the grid cells are built from the cell coordinates shifted by this offset
+CELL_OFFSET = 1 << 30
+# average number of cells crossed by a segment above which the cells are enlarged
+CELLS_PER_SEGMENT = 8
+# number of children of each node of the hierarchy of bounding boxes
+BRANCHING = 8
+PAIRS_PER_CHUNK = 1 << 22
+QUERIES_PER_CHUNK = 1 << 12
+# relative margin on the bounds to keep the nodes in case of rounding errors
+BOUND_TOLERANCE = 1e-9
+
+
+def group_starts(sorted_values: np.ndarray):
+    """ Indexes of the first element of each group of equal values in a sorted array """
+    return np.flatnonzero(np.concatenate([[True], sorted_values[1:] != sorted_values[:-1]]))
+
+
+def first_minimums(groups: np.ndarray, values: np.ndarray):
+    """ Indexes of the first minimal value of each group (the groups are sorted) """
+    starts = group_starts(groups)
+    counts = np.diff(np.append(starts, len(groups)))
+    minimums = np.flatnonzero(values == np.repeat(np.minimum.reduceat(values, starts), counts))
+    return minimums[group_starts(groups[minimums])]
+
+
+def box_squared_bounds(px: np.ndarray, py: np.ndarray, boxes: tuple, nodes: np.ndarray):
+    """ Return the lower and upper bounds of the squared distance of points to the polylines
+    contained in bounding boxes (low_x, low_y, high_x, high_y). The upper bound uses the fact that
+    a polyline touches each side of its bounding box: it is the smallest of the distances to the
+    farthest corner of each side.
+    """
+    low_x, low_y, high_x, high_y = (bound.take(nodes) for bound in boxes)
+    to_low_x = px - low_x
+    to_high_x = high_x - px
+    to_low_y = py - low_y
+    to_high_y = high_y - py
+
+    outside_x = np.maximum(-np.minimum(to_low_x, to_high_x), 0)
+    outside_y = np.maximum(-np.minimum(to_low_y, to_high_y), 0)
+    lower = outside_x * outside_x + outside_y * outside_y
+    np.abs(to_low_x, out=to_low_x)
+    np.abs(to_high_x, out=to_high_x)
+    np.abs(to_low_y, out=to_low_y)
+    np.abs(to_high_y, out=to_high_y)
+    near_x = np.minimum(to_low_x, to_high_x)
+    near_y = np.minimum(to_low_y, to_high_y)
+    far_x = np.maximum(to_low_x, to_high_x)
+    far_y = np.maximum(to_low_y, to_high_y)
+    upper = np.minimum(near_x * near_x + far_y * far_y, far_x * far_x + near_y * near_y)
+    return lower, upper
+
+
+def box_squared_lower_bounds(px: np.ndarray, py: np.ndarray, boxes: tuple, nodes: np.ndarray):
+    """ Return the squared distance of points to bounding boxes (0 inside the box) """
+    low_x, low_y, high_x, high_y = (bound.take(nodes) for bound in boxes)
+    outside_x = np.maximum(np.maximum(low_x - px, px - high_x), 0)
+    outside_y = np.maximum(np.maximum(low_y - py, py - high_y), 0)
+    return outside_x * outside_x + outside_y * outside_y
+
+
+class SegmentIndex:
+    """ Index of the segments of a polyline used to find the nearest segment of points.
+    The points close to the polyline are resolved with a uniform grid whose cells have the size of
+    the segments, each segment being registered in all the cells it crosses. The grid is sparse:
+    only the keys of the non-empty cells are stored in a sorted array. The other points are
+    resolved with a hierarchy of bounding boxes: the first level contains the boxes of the
+    segments and each node of a level bounds BRANCHING consecutive nodes of the previous level.
+    The search starts with the bound given by a greedy descent and only explores the nodes that
+    can be closer than the best distance found so far, so its cost barely depends on the distance
+    to the polyline, but each point costs a few times more than a point resolved in the grid.
+    """
+
+    def __init__(self, points: np.ndarray, cell_size: float = None):
+        points = np.asarray(points, dtype=float)[:, 0:2]
+        if len(points) == 0:
+            raise ValueError("cannot index an empty polyline")
+        if len(points) == 1:
+            points = np.repeat(points, 2, axis=0)
+
+        self.a = points[:-1]
+        self.b = points[1:]
+        self.origin = points.min(axis=0)
+
+        # coordinates stored in separated arrays for fast gathering
+        self.ax, self.ay = self.a[:, 0].copy(), self.a[:, 1].copy()
+        self.abx, self.aby = self.b[:, 0] - self.ax, self.b[:, 1] - self.ay
+        squared_norm = self.abx * self.abx + self.aby * self.aby
+        self.inverse_squared_norm = np.zeros_like(squared_norm)
+        np.divide(1, squared_norm, out=self.inverse_squared_norm, where=squared_norm > 0)
+
+        if cell_size is None:
+            # cells of the size of the segments, but smaller if the polyline covers a dense area
+            lengths = np.linalg.norm(self.b - self.a, axis=1)
+            extent = points.max(axis=0) - self.origin
+            cell_size = min(2 * float(np.median(lengths)), np.sqrt(np.prod(extent) / len(lengths)))
+            cell_size = max(cell_size, float(extent.max()) / (4 * np.sqrt(len(lengths))), 1e-3)
+            # limit the memory used by the segments crossing a lot of cells
+            crossings = np.abs(self.b - self.a).sum() / (CELLS_PER_SEGMENT * len(lengths))
+            cell_size = max(cell_size, float(crossings))
+        self.cell_size = cell_size
+
+        # register each segment in all the cells it crosses
+        segments, ix, iy = segment_cells((self.a - self.origin) / self.cell_size,
+                                         (self.b - self.origin) / self.cell_size)
+        keys = self._key(ix, iy)
+        order = np.argsort(keys, kind='stable')
+        self.segments = segments[order]
+        self.keys, self.starts = np.unique(keys[order], return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.segments))
+
+        # hierarchy of the bounding boxes of consecutive segments, each level ends with an empty
+        # box used to complete the children of its last parent
+        low = np.minimum(self.a, self.b)
+        high = np.maximum(self.a, self.b)
+        self.levels = []
+        while True:
+            self.levels.append(tuple(np.append(bound, limit) for bound, limit in [
+                (low[:, 0], np.inf), (low[:, 1], np.inf),
+                (high[:, 0], -np.inf), (high[:, 1], -np.inf)]))
+            if len(low) <= BRANCHING:
+                break
+            starts = np.arange(0, len(low), BRANCHING)
+            low = np.minimum.reduceat(low, starts, axis=0)
+            high = np.maximum.reduceat(high, starts, axis=0)
+
+    @staticmethod
+    def _key(ix: np.ndarray, iy: np.ndarray):
+        return (ix + CELL_OFFSET) * (CELL_OFFSET << 1) + (iy + CELL_OFFSET)
+
+    def distances(self, px: np.ndarray, py: np.ndarray, segments: np.ndarray):
+        """ Return the signed distances (positive on the left) of points to segments """
+        abx = self.abx.take(segments)
+        aby = self.aby.take(segments)
+        apx = px - self.ax.take(segments)
+        apy = py - self.ay.take(segments)
+        t = np.clip((apx * abx + apy * aby) * self.inverse_squared_norm.take(segments), 0, 1)
+        dx = apx - abx * t
+        dy = apy - aby * t
+        return np.copysign(np.sqrt(dx * dx + dy * dy), abx * apy - aby * apx)
+
+    def nearest(self, points: np.ndarray):
+        """ Return the signed distance to the nearest segment and the index of this segment """
+        points = np.asarray(points, dtype=float)[:, 0:2]
+        px = points[:, 0].copy()
+        py = points[:, 1].copy()
+        best_distance = np.full(len(points), np.inf)
+        best_segment = np.zeros(len(points), dtype=np.int64)
+
+        # the points are first searched in their cell, then in the block of 2x2 cells around
+        # the nearest cell corner. The nearest segment is certain if it is closer than the border
+        # of the searched cells.
+        fx = (px - self.origin[0]) / self.cell_size
+        fy = (py - self.origin[1]) / self.cell_size
+        cx = np.floor(fx).astype(np.int64)
+        cy = np.floor(fy).astype(np.int64)
+        for begin in range(0, len(points), QUERIES_PER_CHUNK):
+            queries = np.arange(begin, min(begin + QUERIES_PER_CHUNK, len(points)))
+            self._search(px, py, queries, [(cx[queries], cy[queries])],
+                         best_distance, best_segment)
+        radius = np.minimum(np.minimum(fx - cx, cx + 1 - fx), np.minimum(fy - cy, cy + 1 - fy))
+        remaining = np.flatnonzero(~(np.abs(best_distance) <= radius * self.cell_size))
+
+        ix = np.floor(fx[remaining] - 0.5).astype(np.int64)
+        iy = np.floor(fy[remaining] - 0.5).astype(np.int64)
+        # the other column and row of the block
+        ox = 2 * ix + 1 - cx[remaining]
+        oy = 2 * iy + 1 - cy[remaining]
+        for begin in range(0, len(remaining), QUERIES_PER_CHUNK):
+            chunk = slice(begin, begin + QUERIES_PER_CHUNK)
+            qx = cx[remaining[chunk]]
+            qy = cy[remaining[chunk]]
+            self._search(px, py, remaining[chunk],
+                         [(ox[chunk], qy), (qx, oy[chunk]), (ox[chunk], oy[chunk])],
+                         best_distance, best_segment)
+        fx = fx[remaining]
+        fy = fy[remaining]
+        radius = np.minimum(np.minimum(fx - ix, ix + 2 - fx), np.minimum(fy - iy, iy + 2 - fy))
+        remaining = remaining[~(np.abs(best_distance[remaining]) <= radius * self.cell_size)]
+
+        for begin in range(0, len(remaining), QUERIES_PER_CHUNK):
+            queries = remaining[begin:begin + QUERIES_PER_CHUNK]
+            qx = px[queries]
+            qy = py[queries]
+            upper = np.square(np.minimum(np.abs(best_distance[queries]), self._descend(qx, qy)))
+            distance, segment = self._explore(qx, qy, upper)
+            best_distance[queries] = distance
+            best_segment[queries] = segment
+
+        return best_distance, best_segment
+
+    def _search(self, px, py, queries, cells, best_distance, best_segment):
+        """ Update the nearest segments of the queries from the segments of cells (ix, iy) """
+        for ix, iy in cells:
+            keys = self._key(ix, iy)
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            found = self.keys[pos] == keys
+            starts = self.starts[pos[found]]
+            counts = self.ends[pos[found]] - starts
+            candidates = self.segments[ranges(starts, counts)]
+            self._update(px, py, np.repeat(queries[found], counts), candidates,
+                         best_distance, best_segment)
+
+    def _update(self, px, py, queries, candidates, best_distance, best_segment):
+        """ Update the nearest segments of the queries (sorted) from pairs (query, candidate) """
+        for begin in range(0, len(queries), PAIRS_PER_CHUNK):
+            q = queries[begin:begin + PAIRS_PER_CHUNK]
+            s = candidates[begin:begin + PAIRS_PER_CHUNK]
+            signed = self.distances(px.take(q), py.take(q), s)
+            # the last candidate wins the ties: a point on a vertex takes the segment it starts
+            nearest = len(q) - 1 - first_minimums(q[::-1], np.abs(signed[::-1]))
+            q, s, signed = q[nearest], s[nearest], signed[nearest]
+
+            improved = np.abs(signed) < np.abs(best_distance[q])
+            best_distance[q[improved]] = signed[improved]
+            best_segment[q[improved]] = s[improved]
+
+    def _children(self, level: int, nodes: np.ndarray):
+        """ Return the BRANCHING children of nodes of a level (of a virtual root above the top
+        level if None) as an array of shape (len(nodes), BRANCHING). The missing children of the
+        last node are replaced by the empty box of the level below.
+        """
+        if level is None:
+            level = len(self.levels)
+            nodes = np.zeros(1, np.int64)
+        empty = len(self.levels[level - 1][0]) - 1
+        return np.minimum(nodes[:, None] * BRANCHING + np.arange(BRANCHING), empty)
+
+    def _descend(self, px, py):
+        """ Return an upper bound of the distance of the points to the polyline, obtained by
+        following the nearest child from the top of the hierarchy
+        """
+        px = px[:, None]
+        py = py[:, None]
+        children = self._children(None, None)
+        for level in range(len(self.levels) - 1, 0, -1):
+            lower = box_squared_lower_bounds(px, py, self.levels[level], children)
+            nearest = children[np.arange(len(children)), np.argmin(lower, axis=1)]
+            children = self._children(level, nearest)
+
+        segments = np.minimum(children, len(self.a) - 1)
+        distances = self.distances(px, py, segments)
+        return np.abs(distances).min(axis=1)
+
+    def _explore(self, px, py, upper, level=None, queries=None, nodes=None):
+        """ Return the signed distance and the index of the nearest segment of the points, from
+        pairs (query, node) of a level sorted by query (the top level by default). 'upper' is an
+        upper bound of the squared distance of each point, updated during the search.
+        """
+        if level is None:
+            level = len(self.levels) - 1
+            queries = np.repeat(np.arange(len(px)), BRANCHING)
+            nodes = np.tile(self._children(None, None)[0], len(px))
+
+        while level > 0:
+            if len(queries) * BRANCHING > PAIRS_PER_CHUNK and queries[0] != queries[-1]:
+                # explore each half of the queries separately to limit the memory
+                middle = np.searchsorted(queries, (queries[0] + queries[-1] + 1) // 2)
+                results = [self._explore(px, py, upper, level, queries[half], nodes[half])
+                           for half in [slice(0, middle), slice(middle, len(queries))]]
+                return tuple(np.concatenate(r) for r in zip(*results))
+
+            lower_bound, upper_bound = box_squared_bounds(px.take(queries), py.take(queries),
+                                                          self.levels[level], nodes)
+            starts = group_starts(queries)
+            upper[queries[starts]] = np.minimum(upper[queries[starts]],
+                                                np.minimum.reduceat(upper_bound, starts))
+            keep = lower_bound <= upper.take(queries) * (1 + BOUND_TOLERANCE)
+            queries = np.repeat(queries[keep], BRANCHING)
+            nodes = self._children(level, nodes[keep]).ravel()
+            level -= 1
+
+        # the segments farther than the bound are skipped before computing the exact distances
+        qx = px.take(queries)
+        qy = py.take(queries)
+        lower_bound = box_squared_lower_bounds(qx, qy, self.levels[0], nodes)
+        keep = lower_bound <= upper.take(queries) * (1 + BOUND_TOLERANCE)
+        queries = queries[keep]
+        nodes = nodes[keep]
+        signed = self.distances(qx[keep], qy[keep], nodes)
+        best = first_minimums(queries, np.abs(signed))
+        return signed[best], nodes[best]
+
+
+def anchor_offset(anchor, ref_anchor):
+    """ Offset of the points of a path when they are expressed in the frame of 'ref_anchor' """
+    e, n, u = enu.geodetic2enu(*anchor, *ref_anchor)
+    return np.array([e, n])
+
+
+def headings(points: np.ndarray):
+    """ Heading of each point computed from the next one (from the previous one for the last) """
+    deltas = np.diff(points, axis=0)
+    if len(deltas) == 0:
+        return np.zeros(len(points))
+    deltas = np.vstack([deltas, deltas[-1:]])
+    return np.arctan2(deltas[:, 1], deltas[:, 0])
+
+
+def statistics(lateral_error: np.ndarray, heading_error: np.ndarray):
+    """ Summary of the absolute errors (lateral in meters and heading in degrees) """
+    if len(lateral_error) == 0:
+        return {'count': 0}
+
+    lateral = np.abs(lateral_error)
+    heading = np.degrees(np.abs(heading_error))
+    return {
+        'count': int(len(lateral)),
+        'lateral_mean': float(lateral.mean()),
+        'lateral_rms': float(np.sqrt(np.mean(lateral ** 2))),
+        'lateral_p50': float(np.percentile(lateral, 50)),
+        'lateral_p95': float(np.percentile(lateral, 95)),
+        'lateral_p99': float(np.percentile(lateral, 99)),
+        'lateral_max': float(lateral.max()),
+        'heading_mean': float(heading.mean()),
+        'heading_p95': float(np.percentile(heading, 95)),
+        'heading_max': float(heading.max()),
+    }
+
+
+class Deviation:
+    """ Per-point errors of an actual path relative to a reference path.
+    The actual points are expressed in the frame (anchor) of the reference path. The zones and
+    sections are the ones of the reference path, associated to each actual point through its
+    nearest reference segment.
+    The computation is the fastest for recorded or planned paths, whose points are close to the
+    other path compared to the spacing of the points (see SegmentIndex).
+    """
+
+    def __init__(self, reference: Path, actual: Path, cell_size: float = None):
+        self.reference = reference
+        self.actual = actual
+
+        reference_points = reference.positions().astype(float)
+        offset = anchor_offset(actual.anchor, reference.anchor)
+        self.points = actual.positions().astype(float) + offset
+
+        reference_index = SegmentIndex(reference_points, cell_size)
+        self.lateral_error, self.reference_segment = reference_index.nearest(self.points)
+
+        segment_headings = headings(reference_points)[self.reference_segment]
+        delta = headings(self.points) - segment_headings
+        self.heading_error = np.arctan2(np.sin(delta), np.cos(delta))
+
+        # the Hausdorff distance also requires the distance of the reference to the actual path
+        reverse_error, _ = SegmentIndex(self.points, cell_size).nearest(reference_points)
+        self.hausdorff = float(max(np.abs(self.lateral_error).max(), np.abs(reverse_error).max()))
+
+    def summary(self):
+        zone_index = ZoneIndex.from_path(self.reference)
+        zones = {}
+        for name in zone_index.names():
+            inside = zone_index.contains(name, self.reference_segment)
+            zones[name] = statistics(self.lateral_error[inside], self.heading_error[inside])
+
+        section_starts = np.array(self.reference.section_indexes(), dtype=np.int64)
+        sections = []
+        if len(section_starts):
+            point_sections = np.searchsorted(section_starts, self.reference_segment, 'right') - 1
+            # the points sorted by section, instead of a scan of all the points for each section
+            order = np.argsort(point_sections, kind='stable')
+            limits = np.searchsorted(point_sections[order], np.arange(len(section_starts) + 1))
+            for i in range(len(section_starts)):
+                inside = order[limits[i]:limits[i + 1]]
+                sections.append(statistics(self.lateral_error[inside], self.heading_error[inside]))
+
+        return {
+            'reference': self.reference.name,
+            'actual': self.actual.name,
+            'hausdorff': self.hausdorff,
+            'global': statistics(self.lateral_error, self.heading_error),
+            'zones': zones,
+            'sections': sections,
+        }
+
+    def save_json(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def save_csv(self, filename: str):
+        """ Save the errors of each point of the actual path (heading error in degrees) """
+        data = np.column_stack([
+            np.arange(len(self.points)),
+            self.points,
+            self.lateral_error,
+            np.degrees(self.heading_error),
+            self.reference_segment,
+        ])
+        np.savetxt(filename, data, delimiter=',', comments='',
+                   header='index,x,y,lateral_error,heading_error,reference_segment',
+                   fmt=['%d', '%.3f', '%.3f', '%.4f', '%.3f', '%d'])
@@ -0,0 +1,46 @@
+""" Cells of a uniform grid covered by polylines """
+import numpy as np
+
+# margin (in cells) added around the segments to be robust to rounding errors
+CELL_MARGIN = 1e-6
+
+
+def ranges(starts: np.ndarray, counts: np.ndarray):
+    """ Concatenation of the ranges [start, start + count[ """
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - offsets
+
+
+def segment_cells(a: np.ndarray, b: np.ndarray):
+    """ Return the arrays (segment, ix, iy) of the cells crossed by the segments [a, b].
+    The coordinates are expressed in cells: the cell (ix, iy) covers [ix, ix + 1[ x [iy, iy + 1[.
+    Each segment is split in the columns of cells it crosses and, in each column, all the cells
+    between the ordinates of its ends in this column are selected.
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    low_x = np.minimum(a[:, 0], b[:, 0])
+    high_x = np.maximum(a[:, 0], b[:, 0])
+    first_column = np.floor(low_x - CELL_MARGIN).astype(np.int64)
+    column_counts = np.floor(high_x + CELL_MARGIN).astype(np.int64) - first_column + 1
+
+    segments = np.repeat(np.arange(len(a)), column_counts)
+    columns = ranges(first_column, column_counts)
+
+    # ordinates of the segments at the borders of each column
+    dx = b[:, 0] - a[:, 0]
+    dy = b[:, 1] - a[:, 1]
+    slope = np.zeros_like(dx)
+    np.divide(dy, dx, out=slope, where=dx != 0)
+    x0 = np.maximum(low_x[segments], columns)
+    x1 = np.minimum(high_x[segments], columns + 1)
+    y0 = a[segments, 1] + (x0 - a[segments, 0]) * slope[segments]
+    y1 = a[segments, 1] + (x1 - a[segments, 0]) * slope[segments]
+    vertical = dx[segments] == 0
+    y0[vertical] = a[segments[vertical], 1]
+    y1[vertical] = b[segments[vertical], 1]
+
+    first_row = np.floor(np.minimum(y0, y1) - CELL_MARGIN).astype(np.int64)
+    row_counts = np.floor(np.maximum(y0, y1) + CELL_MARGIN).astype(np.int64) - first_row + 1
+    return (np.repeat(segments, row_counts), np.repeat(columns, row_counts),
+            ranges(first_row, row_counts))
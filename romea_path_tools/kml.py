@@ -46,13 +46,18 @@ class Kml:
         self.points.append(GeoPoint(lon, lat, alt))
 
     def save(self, filename):
-        with open(filename, 'w') as file:
-            file.write(KML_HEADER_FORMAT.format(os.path.basename(filename)))
+        save_coordinates(filename, (f'{point}\n' for point in self.points))
 
-            for point in self.points:
-                file.write(f'{point}\n')
 
-            file.write(KML_FOOTER)
+def save_coordinates(filename, coordinate_lines):
+    ''' save a KML linestring from an iterable of formatted 'lon,lat,alt' lines '''
+    with open(filename, 'w') as file:
+        file.write(KML_HEADER_FORMAT.format(os.path.basename(filename)))
+
+        for lines in coordinate_lines:
+            file.write(lines)
+
+        file.write(KML_FOOTER)
 
 
 class GeoPolygon:
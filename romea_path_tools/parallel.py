@@ -0,0 +1,140 @@
+""" Conversion of large paths to WGS84 coordinates split in chunks processed by a pool of workers.
+
+The ENU coordinates are stored in a shared memory block read by the workers. Each worker converts
+a chunk of points and either formats them as text or writes the WGS84 coordinates in a shared
+output block. The results are concatenated in the order of the chunks, so the output is identical
+to the one of a serial processing.
+"""
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from pymap3d import enu
+
+CHUNK_SIZE = 1 << 18
+
+
+def wgs84_coordinates(x: np.ndarray, y: np.ndarray, anchor):
+    """ Return the arrays (lat, lon, alt) of ENU coordinates (the altitude of the points is 0) """
+    lat, lon, alt = enu.enu2geodetic(x, y, np.zeros_like(x), *anchor)
+    return np.atleast_1d(lat), np.atleast_1d(lon), np.atleast_1d(alt)
+
+
+def format_wgs84_csv(x: np.ndarray, y: np.ndarray, anchor):
+    lat, lon, alt = wgs84_coordinates(x, y, anchor)
+    lines = zip(lat.tolist(), lon.tolist(), alt.tolist())
+    return ''.join([f'{a},{b},{c}\n' for a, b, c in lines])
+
+
+def format_kml(x: np.ndarray, y: np.ndarray, anchor):
+    """ Same format as the representation of kml.GeoPoint """
+    lat, lon, alt = wgs84_coordinates(x, y, anchor)
+    lines = zip(lat.tolist(), lon.tolist(), np.round(alt, 3).tolist())
+    return ''.join([f'{b:.8f},{a:.8f},{c}\n' for a, b, c in lines])
+
+
+def geojson_coordinates(x: np.ndarray, y: np.ndarray, anchor):
+    """ Return an array of (lon, lat, alt), they are rounded by the GeoJSON serialization """
+    lat, lon, alt = wgs84_coordinates(x, y, anchor)
+    return np.column_stack([lon, lat, alt])
+
+
+FORMATTERS = {
+    'wgs84_csv': format_wgs84_csv,
+    'kml': format_kml,
+}
+
+
+def _worker_format(args):
+    name, point_count, begin, end, anchor, format_type = args
+    block = shared_memory.SharedMemory(name=name)
+    xy = np.ndarray((2, point_count), dtype=np.float64, buffer=block.buf)
+    text = FORMATTERS[format_type](xy[0, begin:end], xy[1, begin:end], anchor)
+    del xy
+    block.close()
+    return text
+
+
+def _worker_geojson(args):
+    name, output_name, point_count, begin, end, anchor = args
+    block = shared_memory.SharedMemory(name=name)
+    output_block = shared_memory.SharedMemory(name=output_name)
+    xy = np.ndarray((2, point_count), dtype=np.float64, buffer=block.buf)
+    output = np.ndarray((point_count, 3), dtype=np.float64, buffer=output_block.buf)
+    output[begin:end] = geojson_coordinates(xy[0, begin:end], xy[1, begin:end], anchor)
+    del xy, output
+    block.close()
+    output_block.close()
+
+
+def job_count(jobs: int):
+    """ Number of workers, 0 means one worker per CPU """
+    return jobs if jobs > 0 else os.cpu_count() or 1
+
+
+def _chunks(point_count: int, chunk_size: int):
+    return [(begin, min(begin + chunk_size, point_count))
+            for begin in range(0, point_count, chunk_size)]
+
+
+def _shared_xy(x: np.ndarray, y: np.ndarray):
+    block = shared_memory.SharedMemory(create=True, size=max(1, 2 * len(x) * 8))
+    xy = np.ndarray((2, len(x)), dtype=np.float64, buffer=block.buf)
+    xy[0] = x
+    xy[1] = y
+    del xy
+    return block
+
+
+def iter_formatted(x: np.ndarray, y: np.ndarray, anchor, format_type: str, jobs: int = 1,
+                   chunk_size: int = CHUNK_SIZE):
+    """ Yield the text lines of the points ('wgs84_csv' or 'kml' format) chunk by chunk """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    chunks = _chunks(len(x), chunk_size)
+    jobs = job_count(jobs)
+
+    if jobs == 1 or len(chunks) < 2:
+        for begin, end in chunks:
+            yield FORMATTERS[format_type](x[begin:end], y[begin:end], anchor)
+        return
+
+    block = _shared_xy(x, y)
+    try:
+        tasks = [(block.name, len(x), begin, end, tuple(anchor), format_type)
+                 for begin, end in chunks]
+        with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+            yield from pool.imap(_worker_format, tasks)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def geojson_sections(x: np.ndarray, y: np.ndarray, anchor, section_lengths: list, jobs: int = 1,
+                     chunk_size: int = CHUNK_SIZE):
+    """ Return the list of sections of [lon, lat, alt] used by the GeoJSON export """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    chunks = _chunks(len(x), chunk_size)
+    jobs = job_count(jobs)
+
+    if jobs == 1 or len(chunks) < 2:
+        coordinates = geojson_coordinates(x, y, anchor)
+    else:
+        block = _shared_xy(x, y)
+        output_block = shared_memory.SharedMemory(create=True, size=3 * len(x) * 8)
+        try:
+            tasks = [(block.name, output_block.name, len(x), begin, end, tuple(anchor))
+                     for begin, end in chunks]
+            with multiprocessing.Pool(min(jobs, len(chunks))) as pool:
+                pool.map(_worker_geojson, tasks)
+            output = np.ndarray((len(x), 3), dtype=np.float64, buffer=output_block.buf)
+            coordinates = output.copy()
+            del output
+        finally:
+            for b in [block, output_block]:
+                b.close()
+                b.unlink()
+
+    bounds = np.cumsum([0] + list(section_lengths)).tolist()
+    return [coordinates[begin:end].tolist() for begin, end in zip(bounds[:-1], bounds[1:])]
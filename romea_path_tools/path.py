@@ -7,6 +7,7 @@ import geojson as gj
 
 from .romea_path import RomeaPath
 from . import kml
+from . import parallel
 
 
 class ParseError(RuntimeError):
@@ -226,46 +227,44 @@ class Path:
             for point in self.points:
                 f.write(','.join(map(str, point)) + '\n')
 
-    def save_wgs84_csv(self, filename):
-        """ Save the path in CSV format. The point are expressed in WGS84 coordinates """
-        with open(filename, 'w') as f:
-            f.write(f'latitude,longitude,altitude\n')
-
-            x_index = self.columns.index('x')
-            y_index = self.columns.index('y')
-
-            for p in self.points:
-                lat, lon, alt = enu.enu2geodetic(p[x_index], p[y_index], 0, *self.anchor)
-                f.write(f'{lat},{lon},{alt}\n')
-
-    def save_kml(self, filename):
-        """ Save the path in KML format. """
-        kml_data = kml.Kml()
+    def coordinates(self, points=None):
+        """ Return the arrays of 'x' and 'y' coordinates of the points (of the path by default) """
+        if points is None:
+            points = self.points
         x_index = self.columns.index('x')
         y_index = self.columns.index('y')
+        x = np.fromiter((p[x_index] for p in points), dtype=float, count=len(points))
+        y = np.fromiter((p[y_index] for p in points), dtype=float, count=len(points))
+        return x, y
 
-        for p in self.points:
-            lat, lon, alt = enu.enu2geodetic(p[x_index], p[y_index], 0, *self.anchor)
-            kml_data.add_point(lon, lat, alt)
+    def save_wgs84_csv(self, filename, jobs=1):
+        """ Save the path in CSV format. The point are expressed in WGS84 coordinates.
+        The conversion is distributed on 'jobs' processes for large paths (0 for all the CPUs).
+        """
+        x, y = self.coordinates()
+        with open(filename, 'w') as f:
+            f.write(f'latitude,longitude,altitude\n')
 
-        kml_data.save(filename)
+            for lines in parallel.iter_formatted(x, y, self.anchor, 'wgs84_csv', jobs):
+                f.write(lines)
 
-    def save_geojson(self, filename):
-        """ Save the path in GeoJSON format. """
-        x_index = self.columns.index('x')
-        y_index = self.columns.index('y')
+    def save_kml(self, filename, jobs=1):
+        """ Save the path in KML format.
+        The conversion is distributed on 'jobs' processes for large paths (0 for all the CPUs).
+        """
+        x, y = self.coordinates()
+        kml.save_coordinates(filename, parallel.iter_formatted(x, y, self.anchor, 'kml', jobs))
 
+    def save_geojson(self, filename, jobs=1):
+        """ Save the path in GeoJSON format.
+        The conversion is distributed on 'jobs' processes for large paths (0 for all the CPUs).
+        """
         origin_point = [self.anchor[1], self.anchor[0], self.anchor[2]]
         origin = gj.Feature(id='origin', geometry=gj.Point(origin_point, precision=8))
 
-        wgs84_sections = []
-        for section in self.sections:
-            wgs84_section = []
-            for p in section:
-                lat, lon, alt = enu.enu2geodetic(p[x_index], p[y_index], 0, *self.anchor)
-                wgs84_section.append([lon, lat, alt])
-
-            wgs84_sections.append(wgs84_section)
+        x, y = self.coordinates([p for section in self.sections for p in section])
+        section_lengths = [len(section) for section in self.sections]
+        wgs84_sections = parallel.geojson_sections(x, y, self.anchor, section_lengths, jobs)
 
         extra = self.extra_columns()
         section_linestrings = gj.MultiLineString(wgs84_sections, precision=8)
@@ -2,30 +2,34 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from .path import Path
+from .zones import ZoneIndex
+
+
+def plot_zone(points: np.ndarray, begin: int, end: int, color):
+  """ Draw a wide band over the points of a zone (from 'begin' to 'end' included) """
+  line, = plt.plot(points[begin:end + 1, 0], points[begin:end + 1, 1], '-',
+      linewidth=13, 
+      alpha=0.3, 
+      color=color,
+      solid_capstyle='butt')
+  return line
+
+
+def zone_color(zone_index: int):
+  """ Return the color used for the n-th zone of a path """
+  colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+  return colors[zone_index % len(colors)]
 
 
 def plot_path(path: Path, handles: dict = {}, offset: np.ndarray = (0, 0)):
   points = path.positions()[:, 0:2] + offset
 
-  color_it = plt.rcParams['axes.prop_cycle']()
-  zones = {}
-  for a in path.annotations:
-    if 'point_index' in a:
-      index = a['point_index']
-      value = a['value']
-      if a['type'] in ['zone_enter', 'zone_exit']:
-        if value not in zones:
-          zones[value] = []
-        zones[value].append(index)
-
-  for zone, delim in zones.items():
-    color = next(color_it)['color']
-    for begin, end in zip(delim[::2], delim[1::2]):
-      handles[zone], = plt.plot(points[begin:end + 1, 0], points[begin:end + 1, 1], '-',
-          linewidth=13, 
-          alpha=0.3, 
-          color=color,
-          solid_capstyle='butt')
+  zone_index = ZoneIndex.from_path(path)
+
+  for i, zone in enumerate(zone_index.names()):
+    color = zone_color(i)
+    for begin, end in zip(*zone_index.intervals(zone)):
+      handles[zone] = plot_zone(points, begin, end, color)
 
   handles[path.name], = plt.plot(points[:, 0], points[:, 1], '.-', markersize=4)
   
@@ -0,0 +1,204 @@
+""" Rules used to select the points of a recorded trajectory from odometry measurements.
+
+A measurement is inserted in the path if the vehicle speed is at least 'minimal_speed' and if its
+distance to the previously inserted point is at least 'minimal_distance' (the first point is
+compared to the origin). A new section is created each time the sign of the speed changes.
+These rules are applied live by the program 'record' (using PointSelector) and offline on arrays of
+logged measurements (using build_path).
+"""
+import warnings
+import numpy as np
+
+from .path import Path
+
+# tolerance on the arc length used to skip the measurements that are too close
+ARC_LENGTH_TOLERANCE = 1e-6
+
+
+class PointSelector:
+    """ Incremental version of the rules, used when the measurements are received one by one """
+
+    def __init__(self, minimal_distance: float, minimal_speed: float):
+        self.min_dist_squared = minimal_distance * minimal_distance
+        self.min_speed = minimal_speed
+        self.previous_x = 0.
+        self.previous_y = 0.
+        self.previous_speed = 0.
+
+    def select(self, x: float, y: float, speed: float):
+        """ Return (is_selected, is_new_section) for a new measurement """
+        diff_x = x - self.previous_x
+        diff_y = y - self.previous_y
+        squared_dist = diff_x * diff_x + diff_y * diff_y
+        if squared_dist < self.min_dist_squared or abs(speed) < self.min_speed:
+            return False, False
+
+        new_section = (speed >= 0) != (self.previous_speed >= 0)
+        self.previous_x = x
+        self.previous_y = y
+        self.previous_speed = speed
+        return True, new_section
+
+
+def select_points(x: np.ndarray, y: np.ndarray, speed: np.ndarray, minimal_distance: float,
+                  minimal_speed: float):
+    """ Return the indexes of the measurements selected by the rules """
+    return select_points_multi(x, y, speed, [minimal_distance], minimal_speed)[minimal_distance]
+
+
+def select_points_multi(x: np.ndarray, y: np.ndarray, speed: np.ndarray, minimal_distances: list,
+                        minimal_speed: float):
+    """ Return a dictionary {minimal_distance: indexes of the selected measurements}.
+    The distance between two points is lower than the arc length between them, so the measurements
+    that are closer than 'minimal_distance' in arc length to the last selected point are skipped
+    using a binary search. The speed filter and the arc length are shared by all the distances.
+    """
+    candidates = np.flatnonzero(np.abs(speed) >= minimal_speed)
+    cx = x[candidates]
+    cy = y[candidates]
+    arc_length = np.concatenate([[0.], np.cumsum(np.hypot(np.diff(cx), np.diff(cy)))])
+    count = len(candidates)
+
+    selections = {}
+    for minimal_distance in minimal_distances:
+        if minimal_distance <= 0:
+            selections[minimal_distance] = candidates
+            continue
+
+        min_dist_squared = minimal_distance * minimal_distance
+
+        # the first point is compared to the origin
+        far_from_origin = cx * cx + cy * cy >= min_dist_squared
+        if not far_from_origin.any():
+            selections[minimal_distance] = candidates[:0]
+            continue
+
+        # for each measurement, the first following one that is far enough in arc length and
+        # whether it is also far enough in distance (which is the case in most of the trajectory)
+        target = arc_length + minimal_distance - ARC_LENGTH_TOLERANCE
+        next_index = np.maximum(np.searchsorted(arc_length, target), np.arange(1, count + 1))
+        clipped = np.minimum(next_index, count - 1)
+        diff_x = cx[clipped] - cx
+        diff_y = cy[clipped] - cy
+        is_far = (diff_x * diff_x + diff_y * diff_y >= min_dist_squared) & (next_index < count)
+        next_index = next_index.tolist()
+        is_far = is_far.tolist()
+
+        i = int(np.argmax(far_from_origin))
+        selected = [i]
+        while True:
+            j = next_index[i]
+            if not is_far[i]:
+                j = next_far_index(cx, cy, i, j, min_dist_squared)
+            if j >= count:
+                break
+            selected.append(j)
+            i = j
+
+        selections[minimal_distance] = candidates[selected]
+
+    return selections
+
+
+def next_far_index(x: np.ndarray, y: np.ndarray, i: int, j: int, min_dist_squared: float):
+    """ Return the first index from j of a point far enough from the point i """
+    xi = x[i].item()
+    yi = y[i].item()
+    for j in range(j, len(x)):
+        diff_x = x[j].item() - xi
+        diff_y = y[j].item() - yi
+        if diff_x * diff_x + diff_y * diff_y >= min_dist_squared:
+            return j
+    return len(x)
+
+
+def round_values(values: np.ndarray, decimals: int = 3):
+    """ Same result as the python function 'round' applied on each value, but vectorized.
+    The values close to a tie are rounded by python since the vectorized version may differ.
+    """
+    scaled = values * 10 ** decimals
+    rounded = np.round(scaled) / 10 ** decimals
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(v, decimals) for v in values[ties].tolist()]
+    return rounded
+
+
+def create_path(x: np.ndarray, y: np.ndarray, speed: np.ndarray, indexes: np.ndarray, anchor):
+    """ Create the path made of the selected measurements """
+    path = Path()
+    path.anchor = tuple(anchor)
+    path.columns = ['x', 'y', 'speed']
+    points = np.column_stack([x[indexes], y[indexes], speed[indexes]])
+    path.points = round_values(points).tolist()
+
+    # a new section starts when the sign of the speed changes (the initial speed is 0)
+    forward = np.concatenate([[True], speed[indexes] >= 0])
+    section_indexes = np.flatnonzero(forward[1:] != forward[:-1]).tolist()
+    if not section_indexes or section_indexes[0] != 0:
+        section_indexes.insert(0, 0)
+    path.create_sections(section_indexes)
+
+    return path
+
+
+def build_path(x: np.ndarray, y: np.ndarray, speed: np.ndarray, minimal_distance: float = 0.1,
+               minimal_speed: float = 0.1, anchor=(0., 0., 0.)):
+    """ Build the path that the program 'record' would create from these measurements """
+    return build_paths(x, y, speed, [minimal_distance], minimal_speed, anchor)[minimal_distance]
+
+
+def build_paths(x: np.ndarray, y: np.ndarray, speed: np.ndarray, minimal_distances: list,
+                minimal_speed: float = 0.1, anchor=(0., 0., 0.)):
+    """ Build a path for each minimal distance and return a dictionary {distance: path} """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    selections = select_points_multi(x, y, speed, minimal_distances, minimal_speed)
+    return {d: create_path(x, y, speed, indexes, anchor) for d, indexes in selections.items()}
+
+
+def load_measurements(source, column_count: int, **kwargs):
+    """ Load the rows of a CSV file, a file without measurements (a robot that never moved) gives
+    an array of shape (0, column_count)
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', 'loadtxt: input contained no data')
+        data = np.loadtxt(source, delimiter=',', ndmin=2, **kwargs)
+    if data.size == 0:
+        return np.empty((0, column_count))
+    return data
+
+
+def load_odometry_csv(filename: str):
+    """ Load the arrays (timestamp, x, y, speed) from a CSV file with a header containing the
+    columns 'x', 'y', 'speed' and optionally 'timestamp'.
+    """
+    with open(filename, 'r') as f:
+        columns = [c.strip() for c in f.readline().split(',')]
+        data = load_measurements(f, len(columns))
+
+    x = data[:, columns.index('x')]
+    y = data[:, columns.index('y')]
+    speed = data[:, columns.index('speed')]
+    timestamp = data[:, columns.index('timestamp')] if 'timestamp' in columns else None
+    return sort_by_time(timestamp, x, y, speed)
+
+
+def load_odometry_echo(filename: str):
+    """ Load the arrays (timestamp, x, y, speed) from the CSV export of a nav_msgs/Odometry topic
+    (obtained with 'ros2 topic echo --csv /odom'). There is no header and the columns are the
+    flattened fields of the message.
+    """
+    # stamp.sec, stamp.nanosec, frame_id, child_frame_id, position (3), orientation (4),
+    # covariance (36), twist.linear.x
+    usecols = (0, 1, 4, 5, 47)
+    data = load_measurements(filename, len(usecols), usecols=usecols)
+    timestamp = data[:, 0] + data[:, 1] * 1e-9
+    return sort_by_time(timestamp, data[:, 2], data[:, 3], data[:, 4])
+
+
+def sort_by_time(timestamp, x, y, speed):
+    if timestamp is not None and np.any(np.diff(timestamp) < 0):
+        order = np.argsort(timestamp, kind='stable')
+        timestamp, x, y, speed = timestamp[order], x[order], y[order], speed[order]
+    return timestamp, x, y, speed
@@ -0,0 +1,137 @@
+""" Index of the zones defined by the 'zone_enter' and 'zone_exit' annotations of a path """
+import copy
+import numpy as np
+
+from .path import Path
+
+
+class ZoneIndex:
+    """ Sorted arrays of intervals [begin, end] (inclusive point indexes) for each zone name.
+    Each 'zone_enter' annotation is paired with the next 'zone_exit' of the same zone. A zone that
+    is never exited ends at the last point of the path. Overlapping intervals of a same zone are
+    merged.
+    """
+
+    def __init__(self, annotations: list, point_count: int = None):
+        opened = {}
+        intervals = {}
+
+        for a in annotations:
+            if 'point_index' not in a or a['type'] not in ['zone_enter', 'zone_exit']:
+                continue
+
+            name = a['value']
+            index = a['point_index']
+            intervals.setdefault(name, [])
+
+            if a['type'] == 'zone_enter':
+                opened.setdefault(name, index)
+            elif name in opened:
+                intervals[name].append((opened.pop(name), index))
+
+        if point_count is not None:
+            for name, begin in opened.items():
+                intervals[name].append((begin, point_count - 1))
+
+        self.begins = {}
+        self.ends = {}
+        for name, zone_intervals in intervals.items():
+            merged = []
+            for begin, end in sorted(zone_intervals):
+                if merged and begin <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([begin, end])
+
+            bounds = np.array(merged, dtype=np.int64).reshape(-1, 2)
+            self.begins[name] = bounds[:, 0]
+            self.ends[name] = bounds[:, 1]
+
+    @staticmethod
+    def from_path(path: Path):
+        return ZoneIndex(path.annotations, len(path.points))
+
+    def names(self):
+        """ Return the zone names in the order of their first annotation """
+        return list(self.begins.keys())
+
+    def intervals(self, name: str):
+        """ Return the arrays of begin and end (inclusive) point indexes of a zone """
+        empty = np.empty(0, dtype=np.int64)
+        return self.begins.get(name, empty), self.ends.get(name, empty)
+
+    def interval_at(self, name: str, index: int):
+        """ Return the (begin, end) interval of the zone containing the point or None """
+        begins, ends = self.intervals(name)
+        pos = np.searchsorted(begins, index, side='right') - 1
+        if pos >= 0 and ends[pos] >= index:
+            return int(begins[pos]), int(ends[pos])
+        return None
+
+    def contains(self, name: str, indexes):
+        """ Return True for each point index (scalar or array) that is inside the zone """
+        begins, ends = self.intervals(name)
+        indexes = np.asarray(indexes)
+        if not len(begins):
+            return np.zeros(indexes.shape, dtype=bool)
+
+        pos = np.searchsorted(begins, indexes, side='right') - 1
+        return (pos >= 0) & (ends[np.maximum(pos, 0)] >= indexes)
+
+    def zones_at(self, index: int):
+        """ Return the names of the zones containing the point """
+        return [name for name in self.names() if self.interval_at(name, index) is not None]
+
+    def mask(self, name: str, point_count: int):
+        """ Return a boolean array of size 'point_count' that is True inside the zone """
+        begins, ends = self.intervals(name)
+        delta = np.zeros(point_count + 1, dtype=np.int64)
+        np.add.at(delta, np.minimum(begins, point_count), 1)
+        np.add.at(delta, np.minimum(ends + 1, point_count), -1)
+        return np.cumsum(delta[:-1]) > 0
+
+    def segments(self, path: Path, name: str):
+        """ Return a sub-path for each interval of the zone """
+        sub_paths = []
+        for k, (begin, end) in enumerate(zip(*self.intervals(name))):
+            sub = sub_path(path, int(begin), int(end) + 1, self)
+            if path.name is not None:
+                sub.name = f'{path.name}_{name}_{k}'
+            sub_paths.append(sub)
+        return sub_paths
+
+
+def sub_path(path: Path, begin: int, end: int, zone_index: ZoneIndex = None):
+    """ Return the path made of the points in [begin, end[.
+    The point lists are shared with the original path (they are not copied). The sections and the
+    annotations are re-based on the first point and the zones crossing the bounds are closed.
+    """
+    if zone_index is None:
+        zone_index = ZoneIndex.from_path(path)
+
+    sub = Path()
+    sub.name = path.name
+    sub.anchor = path.anchor
+    sub.columns = path.columns
+    sub.points = path.points[begin:end]
+    section_starts = [i - begin for i in path.section_indexes() if begin < i < end]
+    sub.create_sections([0] + section_starts)
+
+    annotations = []
+    for a in path.annotations:
+        if 'point_index' not in a:
+            annotations.append(copy.copy(a))
+        elif begin <= a['point_index'] < end:
+            annotations.append({**a, 'point_index': a['point_index'] - begin})
+
+    last = end - 1
+    for name in zone_index.names():
+        interval = zone_index.interval_at(name, begin)
+        if interval is not None and interval[0] < begin:
+            annotations.insert(0, {'type': 'zone_enter', 'point_index': 0, 'value': name})
+        interval = zone_index.interval_at(name, last)
+        if interval is not None and interval[1] > last:
+            annotations.append({'type': 'zone_exit', 'point_index': last - begin, 'value': name})
+
+    sub.annotations = annotations
+    return sub